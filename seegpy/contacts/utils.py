@@ -5,6 +5,7 @@ import logging
 import numpy as np
 from scipy.spatial.distance import cdist
 import pandas as pd
+import re
 from re import findall
 from textwrap import wrap
 
@@ -15,6 +16,13 @@ from seegpy.transform import apply_transform
 
 logger = logging.getLogger('seegpy')
 
+# sEEG label : no symbol, a single group of 1 or 2 letters and a single group
+# of 1 or 2 digits (e.g A1, B'12, TP3)
+_OTHER = r'[^A-Za-z\d!@#$%^&*(),.?":{}|<>+]*'
+_SEEG_LABEL = re.compile(
+    rf'{_OTHER}(?:[A-Za-z]{{1,2}}{_OTHER}\d{{1,2}}|'
+    rf'\d{{1,2}}{_OTHER}[A-Za-z]{{1,2}}){_OTHER}')
+
 
 def clean_contact(c_names):
     """Clean contact's names.
@@ -243,34 +251,11 @@ def detect_seeg_contacts(ch_names, ch_units=None, seeg_unit='uV'):
     if ch_units is None:
         is_units = np.ones((n_chan,), dtype=bool)
     else:
-        is_units = np.array([seeg_unit in k for k in ch_units])
-    # find symbols in channel names
-    is_sym = []
-    for c in ch_names:
-        is_sym += [len(findall('[!@#$%^&*(),.?":{}|<>+]', c))]
-    is_sym = np.array(is_sym, dtype=bool)
-    # split into letter / number
-    is_let, is_num, is_let_len, is_num_len = [], [], [], []
-    for c in ch_names:
-        # detect letters / num
-        _letter = findall(r'[A-Za-z]+', c)
-        _num = findall(r'\d+', c)
-        # keep if there's a letter and a number
-        is_let += [len(_letter)]
-        is_num += [len(_num)]
-        # keep if the length correspond
-        if len(_letter) == 1:
-            is_let_len += [1 <= len(_letter[0]) <= 2]
-        else:
-            is_let_len += [False]
-        if len(_num) == 1:
-            is_num_len += [1 <= len(_num[0]) <= 2]
-        else:
-            is_num_len += [False]
-    is_let = np.array(is_let, dtype=bool)
-    is_num = np.array(is_num, dtype=bool)
-    is_let_len = np.array(is_let_len, dtype=bool)
-    is_num_len = np.array(is_num_len, dtype=bool)
+        ch_units = np.asarray(ch_units, dtype=str)
+        is_units = np.char.find(ch_units, seeg_unit) >= 0
+    # check the form of the channel names (letter / number / symbols)
+    is_label = np.fromiter((_SEEG_LABEL.fullmatch(c) is not None
+                            for c in ch_names), dtype=bool, count=n_chan)
     # looks for duplicates
     is_dup = np.zeros((n_chan,), dtype=bool)
     if len(ch_names) != len(np.unique(ch_names)):
@@ -282,9 +267,7 @@ def detect_seeg_contacts(ch_names, ch_units=None, seeg_unit='uV'):
         for c in dup:
             is_dup[np.where(ch_names == c)[0].max()] = True
     # merge all conditions
-    all_cond = np.c_[is_units, ~is_sym, is_let, is_num, is_let_len, is_num_len,
-        ~is_dup]
-    is_seeg = all_cond.all(axis=1)
+    is_seeg = is_units & is_label & ~is_dup
     seeg_chan = ch_names[is_seeg]
     assert len(seeg_chan) == len(np.unique(seeg_chan))
 
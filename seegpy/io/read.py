@@ -6,11 +6,199 @@ import pandas as pd
 
 import os
 import os.path as op
+from functools import lru_cache
 
 from seegpy.contacts.utils import detect_seeg_contacts
 
 logger = logging.getLogger('seegpy')
 
+# HDF5 raw-data chunk cache (the default 1 MiB is far too small for chunked
+# amplifier data and leads to the same chunks being decompressed repeatedly)
+H5_RDCC_NBYTES = 256 * 1024 * 1024
+H5_RDCC_NSLOTS = 100003  # prime, ~10x the number of cached chunks
+H5_RDCC_W0 = .75
+
+
+def _open_h5(path):
+    """Open an HDF5 file in read mode with a large chunk cache."""
+    import h5py
+    return h5py.File(path, 'r', rdcc_nbytes=H5_RDCC_NBYTES,
+                     rdcc_nslots=H5_RDCC_NSLOTS, rdcc_w0=H5_RDCC_W0)
+
+
+def _prefetch_ranges(path, ranges):
+    """Ask the kernel to asynchronously read-ahead byte ranges of a file.
+
+    ranges is a list of (offset, length) tuples. This is a no-op on platforms
+    without posix_fadvise.
+    """
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    try:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            for offset, length in ranges:
+                os.posix_fadvise(fd, offset, length, os.POSIX_FADV_WILLNEED)
+        finally:
+            os.close(fd)
+    except OSError:
+        logger.debug(f"Read-ahead hint failed for {path}")
+
+
+def _contiguous_runs(idx):
+    """Collapse sorted indices into (start, stop) runs of adjacent values."""
+    idx = np.asarray(idx)
+    if not idx.size:
+        return []
+    breaks = np.flatnonzero(np.diff(idx) != 1) + 1
+    starts = np.r_[idx[0], idx[breaks]]
+    stops = np.r_[idx[breaks - 1], idx[-1]] + 1
+    return list(zip(starts.tolist(), stops.tolist()))
+
+
+def _is_deflate_only(dset):
+    """Check if a 2-D dataset is chunked and only compressed with deflate."""
+    import h5py
+    if (dset.chunks is None) or (dset.ndim != 2) or not (hasattr(
+            dset.id, 'read_direct_chunk') and hasattr(
+            dset.id, 'get_chunk_info_by_coord')):
+        return False
+    plist = dset.id.get_create_plist()
+    filters = [plist.get_filter(k)[0] for k in range(plist.get_nfilters())]
+    return filters == [h5py.h5z.FILTER_DEFLATE]
+
+
+def _read_rows_deflate(dset, sel, out, n_jobs=None):
+    """Read rows of a deflate-compressed dataset, decompressing in parallel.
+
+    The compressed chunks are read sequentially (h5py serializes its calls)
+    and decompressed in a pool of threads (zlib releases the GIL). Each chunk
+    is copied into distinct elements of out, so no locking is needed. At most
+    2 * n_jobs chunks are in flight at once to bound memory, and chunks that
+    were never written are filled with the fill value of the dataset.
+    """
+    import zlib
+    from collections import deque
+    from concurrent.futures import ThreadPoolExecutor
+
+    n_rows, n_cols = dset.shape
+    c_rows, c_cols = dset.chunks
+    n_jobs = n_jobs or os.cpu_count() or 1
+    # output row of each row of the dataset (-1 if not selected)
+    dest = np.full((n_rows,), -1, dtype=np.int64)
+    dest[sel] = np.arange(len(sel))
+
+    def _unpack(r_0, c_0, mask, data):
+        r_1, c_1 = min(r_0 + c_rows, n_rows), min(c_0 + c_cols, n_cols)
+        _dest = dest[r_0:r_1]
+        is_sel = _dest >= 0
+        if data is None:
+            # chunk storage not allocated
+            out[_dest[is_sel], c_0:c_1] = dset.fillvalue
+            return
+        # bit 0 of the mask is set if the deflate filter was skipped
+        buf = data if mask & 1 else zlib.decompress(data)
+        chunk = np.frombuffer(buf, dtype=dset.dtype).reshape(c_rows, c_cols)
+        out[_dest[is_sel], c_0:c_1] = chunk[:r_1 - r_0][is_sel, :c_1 - c_0]
+
+    with ThreadPoolExecutor(max_workers=n_jobs) as ex:
+        futs = deque()
+        for r_0 in np.unique(np.asarray(sel) // c_rows * c_rows).tolist():
+            for c_0 in range(0, n_cols, c_cols):
+                info = dset.id.get_chunk_info_by_coord((r_0, c_0))
+                if info.byte_offset is None:
+                    mask, data = 0, None
+                else:
+                    res = dset.id.read_direct_chunk((r_0, c_0))
+                    mask, data = res if isinstance(res, tuple) else (0, res)
+                futs.append(ex.submit(_unpack, r_0, c_0, mask, data))
+                # bound the number of chunks held in memory
+                while len(futs) >= 2 * n_jobs:
+                    futs.popleft().result()
+        while futs:
+            futs.popleft().result()
+
+
+def _decode_mat_str(node):
+    """Decode a MATLAB string (HDF5 dataset or array of character codes).
+
+    MATLAB 7.3 stores characters as uint16 codes, decoded in a single call.
+    """
+    a = node[()] if hasattr(node, 'id') else node
+    if isinstance(a, str):
+        return a
+    a = np.asarray(a)
+    if a.dtype.kind in 'US':
+        return str(a.ravel()[0]) if a.size else ''
+    a = np.ascontiguousarray(a.ravel())
+    if a.dtype.itemsize == 2:
+        s = a.astype('<u2', copy=False).tobytes().decode('utf-16-le', 'ignore')
+    else:
+        s = a.astype('u1', copy=False).tobytes().decode('ascii', 'ignore')
+    return s.rstrip('\x00')
+
+
+def _read_h5_samples(dset, idx, max_span=64):
+    """Read a 1-D (or MATLAB row / column) HDF5 vector at sorted indices.
+
+    h5py builds one selection per index, so when the indices are dense (the
+    spanned range is at most max_span times the number of indices) the
+    covering range is read as a single block and indexed in memory instead.
+    """
+    if not len(idx):
+        return np.array([], dtype=dset.dtype)
+    idx = np.asarray(idx)
+    is_row = (dset.ndim == 2) and (dset.shape[0] == 1)
+    start, stop = int(idx[0]), int(idx[-1]) + 1
+    if stop - start <= max_span * len(idx):
+        block = dset[0, start:stop] if is_row else dset[start:stop, ...]
+        return block.reshape(-1)[idx - start]
+    if is_row:
+        return dset[0, idx]
+    return dset[idx, ...].reshape(-1)
+
+
+def _trigger_changes_np(trig):
+    """Get the non-zero trigger changes and the indices where they occur.
+
+    Vectorized NumPy version, used when numba is not installed (see
+    _get_trigger_changes).
+    """
+    changed = np.flatnonzero(np.diff(trig)) + 1
+    changed = changed[trig[changed] != 0]
+    return trig[changed], changed
+
+
+def _trigger_changes_loop(trig):
+    """Single-pass version of _trigger_changes_np, compiled with numba."""
+    out_ev = np.empty(len(trig), trig.dtype)
+    out_idx = np.empty(len(trig), np.int64)
+    k = 0
+    prev = trig[0] if len(trig) else 0
+    for i in range(1, len(trig)):
+        cur = trig[i]
+        if (cur != prev) and (cur != 0):
+            out_ev[k] = cur
+            out_idx[k] = i
+            k += 1
+        prev = cur
+    return out_ev[:k], out_idx[:k]
+
+
+@lru_cache(maxsize=1)
+def _get_trigger_changes():
+    """Get the function used to extract the trigger changes.
+
+    numba is an optional dependency, imported on the first call only : the
+    compiled _trigger_changes_loop is used when it is installed, and
+    _trigger_changes_np otherwise.
+    """
+    try:
+        from numba import njit
+    except ImportError:
+        return _trigger_changes_np
+    return njit(cache=True)(_trigger_changes_loop)
+
 
 def read_trm(path, as_transform=True, inverse=False):
     """Read a transformation file.
@@ -30,23 +218,61 @@ def read_trm(path, as_transform=True, inverse=False):
     tr : array_like
         Transformation array
     """
-    tr = np.genfromtxt(path)
+    with open(path) as fh:
+        tr = np.array(fh.read().split(), dtype=np.float64).reshape(4, -1)
     if as_transform:
-        tr = np.vstack((np.c_[tr[1::, :], tr[0, :]], np.array([0, 0, 0, 1])))
+        _tr = np.empty((4, 4), dtype=np.float64)
+        _tr[:3, :3] = tr[1::, :]
+        _tr[:3, 3] = tr[0, :]
+        _tr[3, :] = (0., 0., 0., 1.)
+        tr = _tr
     if inverse:
-        tr = np.linalg.inv(tr)
+        rot, t = tr[:3, :3], tr[:3, 3]
+        if np.abs(rot @ rot.T - np.eye(3)).max() > 1e-6:
+            # non-rigid transformation
+            tr = np.linalg.inv(tr)
+        else:
+            # rigid transformation : inverse is [R^T | -R^T t]
+            _tr = np.empty_like(tr)
+            _tr[:3, :3] = rot.T
+            _tr[:3, 3] = -rot.T @ t
+            _tr[3, :] = (0., 0., 0., 1.)
+            tr = _tr
     return tr
 
 
-def read_contacts_trc(path):
+def _channels_from_segment(seg):
+    """Get the channel names and units of a neo segment."""
+    all_chan = [sig.name.replace(' ', '').strip().upper()
+                for sig in seg.analogsignals]
+    units = [str(sig.units) for sig in seg.analogsignals]
+    return all_chan, units
+
+
+@lru_cache(maxsize=32)
+def _read_contacts_trc_cached(path, mtime):
+    """Read the channels of a TRC file (cached on path and mtime)."""
+    import neo
+    micro = neo.MicromedIO(filename=path)
+    seg = micro.read_segment(signal_group_mode='split-all', lazy=True)
+    all_chan, units = _channels_from_segment(seg)
+    return tuple(all_chan), tuple(units)
+
+
+def read_contacts_trc(path, seg=None):
     """Read the channels that are contained inside a TRC file.
 
-    This function uses the neo python package.
+    This function uses the neo python package. Results are cached per file
+    and invalidated when the file is modified (use
+    read_contacts_trc.cache_clear() to explicitly clear the cache).
 
     Parameters
     ----------
     path : string
         Path to the trc file
+    seg : neo.Segment | None
+        An already loaded segment of the trc file. If None, the header of the
+        file is read
 
     Returns
     -------
@@ -55,17 +281,18 @@ def read_contacts_trc(path):
     units : list
         List of units per channels
     """
-    import neo
-
     # -------------------------------------------------------------------------
     # read the channels
-    micro = neo.MicromedIO(filename=path)
-    seg = micro.read_segment(signal_group_mode='split-all', lazy=True)
-    all_chan = [sig.name.replace(' ', '').strip().upper()
-                for sig in seg.analogsignals]
-    units = [str(sig.units) for sig in seg.analogsignals]
+    if seg is not None:
+        return _channels_from_segment(seg)
+    path = op.abspath(path)
+    mtime = os.stat(path).st_mtime_ns
+    all_chan, units = _read_contacts_trc_cached(path, mtime)
+
+    return list(all_chan), list(units)
 
-    return all_chan, units
+
+read_contacts_trc.cache_clear = _read_contacts_trc_cached.cache_clear
 
 
 def read_3dslicer_fiducial(path):
@@ -81,16 +308,23 @@ def read_3dslicer_fiducial(path):
     df : DataFrame
         DataFrame with the columns label, x, y and z
     """
-    return pd.read_csv(path, skiprows=[0, 1])[['label', 'x', 'y', 'z']]
+    # only parse the required columns, with known types
+    df = pd.read_csv(path, skiprows=[0, 1], engine='c',
+                     usecols=['label', 'x', 'y', 'z'],
+                     dtype={'x': np.float64, 'y': np.float64, 'z': np.float64})
+    return df[['label', 'x', 'y', 'z']]
 
 
-def read_trc(bloc):
+def read_trc(bloc, dtype=np.float32):
     """Read a TRC file.
 
     Parameters
     ----------
     bloc : str
         Path to the bloc to read
+    dtype : data-type | np.float32
+        Data type of the returned raw array (the raw data are converted at
+        read time)
 
     Returns
     -------
@@ -108,18 +342,22 @@ def read_trc(bloc):
     assert op.isfile(bloc)
 
     # -------------------------------------------------------------------------
-    # SAMPLING FREQUENCY
+    # LOAD THE BLOC
     # -------------------------------------------------------------------------
     import neo
     micro = neo.MicromedIO(filename=bloc)
-    seg = micro.read_segment(signal_group_mode='split-all', lazy=True)
+    seg = micro.read_segment(signal_group_mode='split-all', lazy=False)
+
+    # -------------------------------------------------------------------------
+    # SAMPLING FREQUENCY
+    # -------------------------------------------------------------------------
     sf = float(seg.analogsignals[0].sampling_rate)
 
     # -------------------------------------------------------------------------
     # CHANNELS
     # -------------------------------------------------------------------------
-    # read again the channels in first bloc
-    ch_names, ch_units = read_contacts_trc(bloc)
+    # read the channels from the loaded segment
+    ch_names, ch_units = read_contacts_trc(bloc, seg=seg)
     # detect seeg / non-seeg channels
     is_seeg = detect_seeg_contacts(ch_names, ch_units=ch_units, seeg_unit='uV')
     seeg_chan = np.array(ch_names)[is_seeg]
@@ -128,29 +366,30 @@ def read_trc(bloc):
     # -------------------------------------------------------------------------
     # TRIGGERS AND RAW
     # -------------------------------------------------------------------------
-    # load the bloc
-    micro = neo.MicromedIO(filename=bloc)
-    seg = micro.read_segment(signal_group_mode='split-all', lazy=False)
     # read the trigger
     _event = seg.events[0]
     trig_event = np.array(_event.labels).astype(int)
     trig_time = np.array(_event.times)
-    # read the raw data
-    raw = []
-    for c in seeg_nb:
-        raw += [seg.analogsignals[c].squeeze()]
-    raw = np.stack(raw)
+    # read the raw data (directly copied into a preallocated array)
+    n_times = seg.analogsignals[seeg_nb[0]].shape[0] if len(seeg_nb) else 0
+    raw = np.empty((len(seeg_nb), n_times), dtype=dtype)
+    for i, c in enumerate(seeg_nb):
+        _sig = np.asarray(seg.analogsignals[c].magnitude)
+        raw[i] = _sig.reshape(-1)
 
     return sf, raw, seeg_chan.tolist(), trig_event, trig_time
 
 
-def read_pramat(mat_root):
+def read_pramat(mat_root, dtype=np.float32):
     """Read a Pragues file.
 
     Parameters
     ----------
     mat_root : str
         Path to the root matlab folder
+    dtype : data-type | np.float32
+        Data type of the returned raw array (the raw data are converted at
+        read time)
 
     Returns
     -------
@@ -192,31 +431,33 @@ def read_pramat(mat_root):
     cn, ct = [], []
 
     # +++++++++++++++++++++++++++++++++ HDF5 ++++++++++++++++++++++++++++++++++
-    try:
-        f = h5py.File(path_head, 'r')['H']
-        # read channel names and types
-        fc = f['channels']
-        cn = [''.join(chr(i) for i in f[k[0]][:]) for k in list(fc['name'])]
-        ct = [''.join(chr(i) for i in f[k[0]][:]) for k in list(fc['signalType'])]
-    except:
-        logger.error("Extraction failed with HDF5. Trying with scipy")
-
-    # +++++++++++++++++++++++++++++++++ SCIPY +++++++++++++++++++++++++++++++++
-
-    if (not len(cn)) and (not len(ct)):
+    # MATLAB 7.3 files are HDF5 files, older versions are read with scipy
+    is_hdf5 = h5py.is_hdf5(path_head)
+    if is_hdf5:
         try:
-            from scipy.io import loadmat
-            f = loadmat(path_head)['H']
+            f = _open_h5(path_head)['H']
             # read channel names and types
-            fc = f['channels']
-            cn = [k[0][0] for k in fc[0, 0][0, :]]
-            ct = [k[2][0] for k in fc[0, 0][0, :]]
+            channels_grp = f['channels']
+            name_ds = channels_grp['name'][()]
+            type_ds = channels_grp['signalType'][()]
+            cn = [_decode_mat_str(f[k[0]]) for k in name_ds]
+            ct = [_decode_mat_str(f[k[0]]) for k in type_ds]
         except:
-            logger.error("Extraction failed with scipy. Trying with mat73")
+            logger.error("Extraction failed with HDF5. Trying with mat73")
+
+    # +++++++++++++++++++++++++++++++++ SCIPY +++++++++++++++++++++++++++++++++
+
+    else:
+        from scipy.io import loadmat
+        f = loadmat(path_head)['H']
+        # read channel names and types
+        fc = f['channels']
+        cn = [_decode_mat_str(k[0]) for k in fc[0, 0][0, :]]
+        ct = [_decode_mat_str(k[2]) for k in fc[0, 0][0, :]]
 
     # +++++++++++++++++++++++++++++++++ MAT73 +++++++++++++++++++++++++++++++++
 
-    if (not len(cn)) and (not len(ct)):
+    if is_hdf5 and (not len(cn)) and (not len(ct)):
         import mat73
         f = mat73.loadmat(path_head)['H']
         fc = f['channels']
@@ -235,22 +476,57 @@ def read_pramat(mat_root):
     # TRIGGER
     # -------------------------------------------------------------------------
     # sampling frequency
-    f = h5py.File(path_raw, 'r')
+    f = _open_h5(path_raw)
     sf = float(np.array(f['srate'])[0][0])
-    # load the time vector
-    times = np.array(f['time']).squeeze()
-    # load trigger data
-    trig_event = np.round(f['raw'][-1, :]).astype(int).squeeze()
-    # keep only the first trigger changes (rm duplicates)
-    first_only = np.where(trig_event[1::] - trig_event[:-1])[0] + 1
-    trig_event = trig_event[first_only]
-    times = times[first_only]
-    # remove inter zeros
-    nnz = trig_event != 0
-    trig_event = trig_event[nnz]
-    trig_time = times[nnz]
-    # now extract the raw data
-    raw = np.array(f['raw'][is_seeg, :])
+    dset, time_ds = f['raw'], f['time']
+    shape, ds_dtype = dset.shape, dset.dtype
+    sel = np.where(is_seeg)[0]
+    offset = dset.id.get_offset()
+    is_contiguous = (offset is not None) and (dset.chunks is None) and (
+        dset.compression is None) and ds_dtype.isnative
+    if is_contiguous:
+        # let the kernel prefetch the bytes of the sEEG rows while the
+        # triggers are extracted
+        row_bytes = shape[1] * ds_dtype.itemsize
+        _prefetch_ranges(path_raw, [
+            (offset + start * row_bytes, (stop - start) * row_bytes)
+            for start, stop in _contiguous_runs(sel)])
+    # load trigger data (rounded in place)
+    trig_raw = dset[-1, :].squeeze()
+    if trig_raw.dtype.kind == 'f':
+        np.rint(trig_raw, out=trig_raw)
+    trig_event = trig_raw.astype(np.int32, copy=False)
+    # keep only the first non-zero trigger changes (rm duplicates and inter
+    # zeros) and only read the times of those changes
+    trig_event, changed = _get_trigger_changes()(trig_event)
+    trig_time = _read_h5_samples(time_ds, changed)
+    # now extract the raw data, converted to dtype at read time into a
+    # preallocated array
+    n_cols = shape[1]
+    raw = np.empty((sel.size, n_cols), dtype=dtype)
+    if is_contiguous:
+        # contiguous and uncompressed : memory-map the dataset and bypass the
+        # HDF5 read stack
+        arr = np.memmap(path_raw, mode='r', shape=shape, dtype=ds_dtype,
+                        offset=offset)
+        pos = 0
+        for start, stop in _contiguous_runs(sel):
+            raw[pos:pos + stop - start] = arr[start:stop, :]
+            pos += stop - start
+        del arr
+    elif sel.size and _is_deflate_only(dset):
+        # chunked and compressed : parallel decompression of the chunks
+        _read_rows_deflate(dset, sel, raw, n_jobs=os.cpu_count())
+    else:
+        # chunked : each run of adjacent sEEG channels is read as a single
+        # block, directly into its slice of the array (HDF5 does the type
+        # conversion)
+        pos = 0
+        for start, stop in _contiguous_runs(sel):
+            n_run = stop - start
+            dset.read_direct(raw, source_sel=np.s_[start:stop, :],
+                             dest_sel=np.s_[pos:pos + n_run, :])
+            pos += n_run
 
     return sf, raw, seeg_chan.tolist(), trig_event, trig_time
 
@@ -53,6 +53,25 @@ def test_located_contacts(xyz, names):
     print("-> [TEST] Contacts are sorted : OK")
 
 
+def test_detect_seeg_contacts():
+    """Test the detection of sEEG / non-sEEG channels."""
+    from seegpy.contacts.utils import detect_seeg_contacts
+
+    # channel names
+    names = ['A1', "B'12", 'TP3', 'ABC1', 'A1B', 'A+1', 'A123', 'ECG', '12']
+    is_seeg = detect_seeg_contacts(names)
+    np.testing.assert_array_equal(is_seeg, [True, True, True, False, False,
+                                            False, False, False, False])
+    # channel units
+    units = ['uV', 'uV', 'mV', 'uV', 'uV', 'uV', 'uV', 'uV', 'uV']
+    is_seeg = detect_seeg_contacts(names, ch_units=units, seeg_unit='uV')
+    np.testing.assert_array_equal(is_seeg, [True, True, False, False, False,
+                                            False, False, False, False])
+    # duplicates (only the first occurrence is kept)
+    is_seeg = detect_seeg_contacts(['A1', 'A2', 'A1', 'B1'])
+    np.testing.assert_array_equal(is_seeg, [True, True, False, True])
+
+
 
 if __name__ == '__main__':
     from seegpy.io import read_3dslicer_fiducial
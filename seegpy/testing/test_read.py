@@ -0,0 +1,237 @@
+"""Test reading functions."""
+import os
+import os.path as op
+import sys
+
+import numpy as np
+import pytest
+
+from seegpy.io import read_3dslicer_fiducial, read_trm
+
+
+def _write_trm(path, tr):
+    """Write a (4, 4) transformation in the trm format."""
+    with open(path, 'w') as f:
+        for row in np.r_[tr[np.newaxis, :3, 3], tr[:3, :3]]:
+            f.write(' '.join([str(k) for k in row]) + '\n')
+
+
+def test_read_trm(tmp_path):
+    """Test reading a trm file."""
+    path = str(tmp_path / 'tr.trm')
+    tr = np.array([[0.5, 1., 2., 10.], [3., 4., 5., -20.],
+                   [6., 7., 8., 30.5], [0., 0., 0., 1.]])
+    _write_trm(path, tr)
+    np.testing.assert_array_equal(read_trm(path), tr)
+    # raw array contained in the file
+    np.testing.assert_array_equal(read_trm(path, as_transform=False),
+                                  np.genfromtxt(path))
+
+
+def test_read_trm_inverse(tmp_path):
+    """Test the inversion of rigid and non-rigid trm transformations."""
+    path = str(tmp_path / 'tr.trm')
+    theta = np.pi / 5
+    rigid = np.array([[np.cos(theta), -np.sin(theta), 0., 10.],
+                      [np.sin(theta), np.cos(theta), 0., -20.],
+                      [0., 0., 1., 30.5], [0., 0., 0., 1.]])
+    non_rigid = rigid.copy()
+    non_rigid[:3, :3] *= [[1.], [2.], [.5]]
+    for tr in [rigid, non_rigid]:
+        _write_trm(path, tr)
+        inv = read_trm(path, inverse=True)
+        np.testing.assert_allclose(inv, np.linalg.inv(tr), atol=1e-12)
+        np.testing.assert_allclose(inv @ tr, np.eye(4), atol=1e-12)
+
+
+def test_read_3dslicer_fiducial():
+    """Test reading a fiducial fcsv file."""
+    df = read_3dslicer_fiducial(op.join(op.dirname(__file__),
+                                        'fiducial.fcsv'))
+    assert list(df.columns) == ['label', 'x', 'y', 'z']
+    assert list(df['label']) == ['A1', 'A2', "B'1"]
+    np.testing.assert_array_equal(df[['x', 'y', 'z']].values, [
+        [-21.5, 12., 3.25], [-25., 12.5, 3.5], [30.75, -8., 14.]])
+    assert (df[['x', 'y', 'z']].dtypes == np.float64).all()
+
+
+def test_read_rows_deflate(tmp_path):
+    """Test the parallel reading of deflate-compressed rows."""
+    h5py = pytest.importorskip('h5py')
+    from seegpy.io.read import _is_deflate_only, _read_rows_deflate
+
+    path = str(tmp_path / 'raw.h5')
+    data = np.random.rand(6, 3000)
+    with h5py.File(path, 'w') as f:
+        f.create_dataset('full', data=data, chunks=(2, 1000),
+                         compression='gzip')
+        # only the first chunk is written, the others are not allocated
+        dset = f.create_dataset('sparse', (6, 3000), dtype='f8',
+                                chunks=(2, 1000), compression='gzip',
+                                fillvalue=7.)
+        dset[0:2, 0:1000] = data[0:2, 0:1000]
+    sel = np.array([0, 1, 3, 4])
+    with h5py.File(path, 'r') as f:
+        for name in ['full', 'sparse']:
+            dset = f[name]
+            assert _is_deflate_only(dset)
+            out = np.empty((len(sel), 3000), dtype=np.float32)
+            _read_rows_deflate(dset, sel, out, n_jobs=2)
+            np.testing.assert_array_equal(
+                out, dset[:][sel, :].astype(np.float32))
+
+
+def _write_pramat(root, h5py, raw, names, types, time_shape, **kw):
+    """Write a minimal MATLAB 7.3 Prague folder."""
+    os.makedirs(op.join(root, 'alignedData'))
+    os.makedirs(op.join(root, 'rawData', 'amplifierData'))
+    with h5py.File(op.join(root, 'alignedData', 'header.mat'), 'w') as f:
+        chan = f.create_group('H').create_group('channels')
+        for key, values in [('name', names), ('signalType', types)]:
+            refs = []
+            for n_v, v in enumerate(values):
+                ds = f.create_dataset(f'#refs#/{key}{n_v}', data=np.array(
+                    [ord(c) for c in v], dtype=np.uint16)[:, np.newaxis])
+                refs += [[ds.ref]]
+            chan.create_dataset(key, data=refs, dtype=h5py.ref_dtype)
+    n_times = raw.shape[1]
+    path_raw = op.join(root, 'rawData', 'amplifierData', 'iEEG.mat')
+    with h5py.File(path_raw, 'w') as f:
+        f.create_dataset('srate', data=[[512.]])
+        f.create_dataset('time', data=np.arange(n_times).reshape(
+            time_shape) / 512.)
+        f.create_dataset('raw', data=raw, **kw)
+
+
+@pytest.mark.parametrize('kw', [dict(), dict(chunks=(2, 100)),
+                                dict(chunks=(2, 100), compression='gzip'),
+                                dict(chunks=(2, 100), compression='gzip',
+                                     shuffle=True)])
+@pytest.mark.parametrize('time_shape', [(1, -1), (-1, 1)])
+def test_read_pramat(tmp_path, kw, time_shape):
+    """Test reading a Prague folder."""
+    h5py = pytest.importorskip('h5py')
+    from seegpy.io import read_pramat
+
+    names = ['A1', 'A2', 'ECG', 'B1', 'B2', 'B3', 'TRIG']
+    types = ['SEEG', 'SEEG', 'ECG', 'SEEG', 'SEEG', 'SEEG', 'TRIG']
+    raw = np.random.rand(len(names), 1000)
+    trig = np.zeros((1000,))
+    trig[100:110], trig[500:520], trig[800:] = 3., 12., 3.
+    raw[-1, :] = trig
+    root = str(tmp_path / 'pramat')
+    _write_pramat(root, h5py, raw, names, types, time_shape, **kw)
+    sf, data, chan, ev, time = read_pramat(root)
+    assert sf == 512.
+    assert chan == ['A1', 'A2', 'B1', 'B2', 'B3']
+    np.testing.assert_array_equal(data, raw[[0, 1, 3, 4, 5]].astype(
+        np.float32))
+    assert data.dtype == np.float32
+    np.testing.assert_array_equal(ev, [3, 12, 3])
+    np.testing.assert_array_equal(time, np.array([100, 500, 800]) / 512.)
+
+
+def test_trigger_changes():
+    """Test the NumPy and single-pass trigger extractions."""
+    from seegpy.io.read import _trigger_changes_np, _trigger_changes_loop
+
+    trig = np.array([0, 0, 3, 3, 0, 12, 12, 5, 0, 0, 3], dtype=np.int32)
+    for fcn in [_trigger_changes_np, _trigger_changes_loop]:
+        ev, idx = fcn(trig)
+        np.testing.assert_array_equal(ev, [3, 12, 5, 3])
+        np.testing.assert_array_equal(idx, [2, 5, 7, 10])
+        ev, idx = fcn(trig[:0])
+        assert not len(ev) and not len(idx)
+
+
+def test_trigger_changes_numba():
+    """Test the numba-compiled trigger extraction against NumPy."""
+    pytest.importorskip('numba')
+    from seegpy.io.read import _trigger_changes_np, _get_trigger_changes
+
+    fcn = _get_trigger_changes()
+    assert fcn is not _trigger_changes_np
+    assert _get_trigger_changes() is fcn
+    rnd = np.random.RandomState(0)
+    trig = rnd.choice([0, 0, 0, 1, 3, 12], size=(10000,)).astype(np.int32)
+    trig = np.repeat(trig, rnd.randint(1, 5, size=(10000,)))
+    for _trig in [trig, trig[:0], trig[:1]]:
+        ev, idx = fcn(_trig)
+        ev_np, idx_np = _trigger_changes_np(_trig)
+        np.testing.assert_array_equal(ev, ev_np)
+        np.testing.assert_array_equal(idx, idx_np)
+
+
+class _StubSignal(object):
+    """Minimal neo analog signal."""
+
+    def __init__(self, name, units, data):
+        self.name, self.units, self.magnitude = name, units, data
+        self.shape, self.sampling_rate = data.shape, 512.
+
+
+def _stub_neo(n_open):
+    """Minimal neo module counting how many times a file is opened."""
+    import types
+
+    names = ['A 1', "B'2", 'ECG', 'B3']
+    units = ['uV', 'uV', 'mV', 'uV']
+
+    class MicromedIO(object):
+        def __init__(self, filename):
+            n_open.append(filename)
+
+        def read_segment(self, signal_group_mode='split-all', lazy=False):
+            seg = types.SimpleNamespace()
+            seg.analogsignals = [_StubSignal(n, u, np.full((
+                100, 1), n_s + .75)) for n_s, (n, u) in enumerate(zip(
+                    names, units))]
+            seg.events = [types.SimpleNamespace(labels=['3', '12'],
+                                                times=[.5, 1.5])]
+            return seg
+
+    return types.SimpleNamespace(MicromedIO=MicromedIO)
+
+
+def test_read_trc(tmp_path, monkeypatch):
+    """Test reading TRC files (and the cache of read_contacts_trc)."""
+    from seegpy.io import read_contacts_trc, read_trc
+
+    n_open = []
+    monkeypatch.setitem(sys.modules, 'neo', _stub_neo(n_open))
+    path = str(tmp_path / 'bloc.TRC')
+    open(path, 'w').close()
+    read_contacts_trc.cache_clear()
+
+    # channels are only read once
+    chan, units = read_contacts_trc(path)
+    assert chan == ['A1', "B'2", 'ECG', 'B3']
+    assert units == ['uV', 'uV', 'mV', 'uV']
+    chan.append('Z1')
+    units.clear()
+    assert read_contacts_trc(path) == (['A1', "B'2", 'ECG', 'B3'],
+                                      ['uV', 'uV', 'mV', 'uV'])
+    assert len(n_open) == 1
+    # modifying the file invalidates the cache
+    mtime = os.stat(path).st_mtime_ns + 10 ** 9
+    os.utime(path, ns=(mtime, mtime))
+    read_contacts_trc(path)
+    assert len(n_open) == 2
+    # explicit invalidation
+    read_contacts_trc.cache_clear()
+    read_contacts_trc(path)
+    assert len(n_open) == 3
+    read_contacts_trc.cache_clear()
+
+    # the loaded segment is reused and the raw data are cast to dtype
+    n_open.clear()
+    for dtype in [np.float32, np.int16]:
+        sf, raw, chan, ev, time = read_trc(path, dtype=dtype)
+        assert sf == 512.
+        assert chan == ['A1', "B'2", 'B3']
+        assert raw.dtype == dtype
+        np.testing.assert_array_equal(raw, np.array([
+            [.75] * 100, [1.75] * 100, [3.75] * 100]).astype(dtype))
+        np.testing.assert_array_equal(ev, [3, 12])
+        np.testing.assert_array_equal(time, [.5, 1.5])
+    assert len(n_open) == 2